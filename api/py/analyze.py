@@ -1,173 +1,335 @@
-from http.server import BaseHTTPRequestHandler
-import json
+import io
+import logging
+import math
+import os
+import threading
+import time
+from functools import lru_cache
+from typing import NamedTuple
+from concurrent.futures import Future
+import requests
 import yfinance as yf
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
-
-class handler(BaseHTTPRequestHandler):
-    def do_POST(self):
-        if self.path == '/api/py/analyze':
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            data = json.loads(post_data.decode('utf-8'))
-
-            symbol = data.get('symbol', 'AAPL')
-            timeframe = data.get('timeframe', '15m')
-
-            try:
-                result = self.analyze_stock(symbol, timeframe)
-                self.send_response(200)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                self.wfile.write(json.dumps(result).encode())
-            except Exception as e:
-                self.send_response(500)
-                self.send_header('Content-type', 'application/json')
-                self.send_header('Access-Control-Allow-Origin', '*')
-                self.end_headers()
-                self.wfile.write(json.dumps({'error': str(e)}).encode())
+from cachetools import TTLCache
+from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+# In-process cache for a warm function instance; it is lost on cold starts.
+# Intraday bars go stale quickly; daily bars only change once per session.
+# Unlike backend/main.py there is no stale-while-revalidate here: the platform
+# freezes the instance once it responds, so a background refresh could stall
+# for longer than the TTL and leave later requests waiting on it.
+_history_ttls = {'15m': 60, '1d': 3600}
+_history_caches = {
+    timeframe: TTLCache(maxsize=1024, ttl=ttl) for timeframe, ttl in _history_ttls.items()
+}
+_cache_lock = threading.Lock()
+_inflight = {}
+
+# One keep-alive session reused by every Yahoo request while this instance
+# stays warm, instead of one per Ticker
+_session = requests.Session()
+
+@lru_cache(maxsize=2048)
+def _ticker(symbol):
+    return yf.Ticker(symbol, session=_session)
+
+def _fetch_history(symbol, timeframe):
+    ticker = _ticker(symbol)
+
+    if timeframe == "15m":
+        return ticker.history(period="7d", interval="15m")
+    return ticker.history(period="1y", interval="1d")
+
+# Optional second tier shared by every instance of this function; redis is
+# only imported when it is configured, and frames are stored as parquet, so
+# it stays off unless pyarrow is installed too (it is not in
+# requirements.txt). Short socket timeouts keep a hung Redis from stalling
+# cache misses.
+_redis = None
+if os.environ.get('REDIS_URL'):
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        logger.warning('REDIS_URL is set but pyarrow is not installed; Redis history cache disabled')
+    else:
+        import redis
+        _redis = redis.Redis.from_url(
+            os.environ['REDIS_URL'], socket_connect_timeout=0.5, socket_timeout=0.5
+        )
+
+def _load_history(symbol, timeframe, ttl):
+    """Fetch history through the shared Redis cache when configured.
+
+    Returns (df, fetched_at). A frame read from Redis is stamped with the start
+    of its bucket, so reloading it never makes it look fresher than it is.
+    """
+    if _redis is None:
+        return _fetch_history(symbol, timeframe), time.time()
+
+    # Keys roll over on TTL boundaries, so all instances agree on freshness
+    bucket = int(time.time() // ttl)
+    key = f'history:{symbol}:{timeframe}:{bucket}'
+    # Any Redis or parquet failure (timeout, corrupt payload) is logged and
+    # falls through to Yahoo
+    try:
+        payload = _redis.get(key)
+        if payload is not None:
+            return pd.read_parquet(io.BytesIO(payload)), bucket * ttl
+    except Exception:
+        logger.warning('Redis history read failed for %s', key, exc_info=True)
+
+    df = _fetch_history(symbol, timeframe)
+    fetched_at = time.time()
+    if not df.empty:
+        try:
+            buf = io.BytesIO()
+            df.to_parquet(buf)
+            _redis.set(key, buf.getvalue(), ex=int(ttl))
+        except Exception:
+            logger.warning('Redis history write failed for %s', key, exc_info=True)
+    return df, fetched_at
+
+def _refresh_history(symbol, timeframe, future):
+    """Fetch into the cache and resolve the in-flight future for this key"""
+    frame = '15m' if timeframe == '15m' else '1d'
+    key = (symbol, timeframe)
+    try:
+        df, fetched_at = _load_history(symbol, timeframe, _history_ttls[frame])
+        if not df.empty:
+            with _cache_lock:
+                _history_caches[frame][key] = (df, fetched_at)
+        future.set_result(df)
+    except Exception as e:
+        future.set_exception(e)
+    finally:
+        with _cache_lock:
+            _inflight.pop(key, None)
+
+def _cached_history(symbol, timeframe):
+    """Return price history, hitting Yahoo at most once per key per TTL"""
+    frame = '15m' if timeframe == '15m' else '1d'
+    key = (symbol, timeframe)
+
+    with _cache_lock:
+        entry = _history_caches[frame].get(key)
+        # Frames from Redis are stamped with their bucket start, so they can
+        # expire before the cache (which times from insertion) evicts them
+        if entry is not None and time.time() - entry[1] < _history_ttls[frame]:
+            return entry[0]
+        # Concurrent misses on the same key wait on the one pending fetch
+        future = _inflight.get(key)
+        if future is not None:
+            leader = False
         else:
-            self.send_response(404)
-            self.end_headers()
-
-    def do_OPTIONS(self):
-        self.send_response(200)
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.end_headers()
-
-    def analyze_stock(self, symbol, timeframe):
-        # Fetch data
-        ticker = yf.Ticker(symbol)
-
-        if timeframe == "15m":
-            df = ticker.history(period="7d", interval="15m")
+            leader = True
+            future = Future()
+            _inflight[key] = future
+
+    if leader:
+        _refresh_history(symbol, timeframe, future)
+    return future.result()
+
+def _ewm_step(value, old_wt, x, alpha):
+    """One step of pandas ewm(adjust=False); returns (value, old_wt).
+
+    A NaN observation leaves the value as is but decays its weight, so the
+    next real observation counts for more, exactly as pandas does.
+    """
+    if value != value:
+        return x, 1.0
+    old_wt *= 1.0 - alpha
+    if x == x:
+        value = (old_wt * value + alpha * x) / (old_wt + alpha)
+        old_wt = 1.0
+    return value, old_wt
+
+def _latest_indicators(close):
+    """Return the last bar's SMA(20), SMA(50), RSI(14), MACD and MACD signal.
+
+    Matches pandas rolling means (NaN until the window is full) for the SMAs
+    and the 14-bar mean gain/loss RSI, and ewm(adjust=False) for the MACD
+    lines. Everything but the SMAs comes from a single pass over close.
+    """
+    n = len(close)
+    sma_20 = float(close[-20:].mean()) if n >= 20 else math.nan
+    sma_50 = float(close[-50:].mean()) if n >= 50 else math.nan
+
+    a_fast, a_slow, a_sign = 2.0 / 13.0, 2.0 / 27.0, 2.0 / 10.0
+    gain_sum = loss_sum = 0.0
+    ema_fast = ema_slow = signal = math.nan
+    w_fast = w_slow = w_sign = 1.0
+    macd = prev = math.nan
+
+    # One pass: the MACD lines are recursive and need every bar, and the RSI
+    # sums ride along over the last 14 deltas
+    for i, x in enumerate(close.tolist()):
+        if i >= n - 14:
+            # The first bar has no delta, and a delta touching a NaN close
+            # counts as neither gain nor loss, like the pandas where()
+            d = x - prev
+            if d > 0.0:
+                gain_sum += d
+            elif d < 0.0:
+                loss_sum -= d
+        prev = x
+
+        ema_fast, w_fast = _ewm_step(ema_fast, w_fast, x, a_fast)
+        ema_slow, w_slow = _ewm_step(ema_slow, w_slow, x, a_slow)
+        macd = ema_fast - ema_slow
+        signal, w_sign = _ewm_step(signal, w_sign, macd, a_sign)
+
+    rsi = math.nan
+    if n >= 14:
+        if loss_sum > 0.0:
+            rsi = 100.0 - 100.0 / (1.0 + gain_sum / loss_sum)
+        elif gain_sum > 0.0:
+            rsi = 100.0
+
+    return sma_20, sma_50, rsi, macd, signal
+
+# Signal bits: each check sets its bit in either the bullish or the bearish mask
+TREND = 1           # SMA 20 above / below SMA 50
+RSI_EXTREME = 2     # RSI oversold / overbought
+MACD_CROSS = 4      # MACD above / below its signal line
+PRICE_VS_SMA20 = 8  # Close above / below SMA 20
+
+def _classify_signal(bullish_signals, bearish_signals):
+    if bullish_signals >= 3:
+        return "BUY", "STRONG"
+    if bullish_signals >= 2:
+        return "BUY", "MODERATE"
+    if bearish_signals >= 3:
+        return "SELL", "STRONG"
+    if bearish_signals >= 2:
+        return "SELL", "MODERATE"
+    return "HOLD", "NEUTRAL"
+
+# (signal, strength) for every (bullish, bearish) count pair, indexed bull * 5 + bear
+_SIGNAL_TABLE = tuple(
+    _classify_signal(bull, bear) for bull in range(5) for bear in range(5)
+)
+
+class Indicators(NamedTuple):
+    close: float
+    sma_20: float
+    sma_50: float
+    rsi: float
+    macd: float
+    macd_signal: float
+
+def compute_latest_indicators(close):
+    """Indicator values for the most recent bar"""
+    return Indicators(float(close[-1]), *_latest_indicators(close))
+
+app = FastAPI(default_response_class=ORJSONResponse)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=['*'],
+    allow_methods=['POST', 'OPTIONS'],
+    allow_headers=['Content-Type'],
+)
+
+class AnalysisRequest(BaseModel):
+    symbol: str = 'AAPL'
+    timeframe: str = '15m'
+
+@app.post('/api/py/analyze')
+async def analyze(request: AnalysisRequest):
+    try:
+        # Fetch and indicator math are blocking; keep them off the event loop
+        result = await run_in_threadpool(analyze_stock, request.symbol, request.timeframe)
+        # Returned as a response so FastAPI skips jsonable_encoder on it
+        return ORJSONResponse(result)
+    except Exception as e:
+        return ORJSONResponse({'error': str(e)}, status_code=500)
+
+def analyze_stock(symbol, timeframe):
+    # Fetch data (shared with other requests through the cache; not mutated)
+    df = _cached_history(symbol, timeframe)
+
+    if df.empty:
+        raise ValueError(f"No data found for {symbol}")
+
+    # Only the latest bar feeds the signal, and price_data carries no
+    # indicator columns, so skip computing the full series
+    latest = compute_latest_indicators(df['Close'].to_numpy(dtype=np.float64))
+
+    # Generate signals
+    bullish = bearish = 0
+    if not math.isnan(latest.sma_20) and not math.isnan(latest.sma_50):
+        if latest.sma_20 > latest.sma_50:
+            bullish |= TREND
         else:
-            df = ticker.history(period="1y", interval="1d")
-
-        if df.empty:
-            raise ValueError(f"No data found for {symbol}")
-
-        # Calculate SMA
-        df['SMA_20'] = df['Close'].rolling(window=20).mean()
-        df['SMA_50'] = df['Close'].rolling(window=50).mean()
-
-        # Calculate RSI
-        delta = df['Close'].diff()
-        gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
-        rs = gain / loss
-        df['RSI'] = 100 - (100 / (1 + rs))
-
-        # Calculate MACD
-        exp1 = df['Close'].ewm(span=12, adjust=False).mean()
-        exp2 = df['Close'].ewm(span=26, adjust=False).mean()
-        df['MACD'] = exp1 - exp2
-        df['MACD_Signal'] = df['MACD'].ewm(span=9, adjust=False).mean()
-
-        latest = df.iloc[-1]
-
-        # Generate signals
-        signals = []
-        if pd.notna(latest['SMA_20']) and pd.notna(latest['SMA_50']):
-            if latest['SMA_20'] > latest['SMA_50']:
-                signals.append('bullish_trend')
-            else:
-                signals.append('bearish_trend')
-
-        if pd.notna(latest['RSI']):
-            if latest['RSI'] < 30:
-                signals.append('oversold')
-            elif latest['RSI'] > 70:
-                signals.append('overbought')
-
-        if pd.notna(latest['MACD']) and pd.notna(latest['MACD_Signal']):
-            if latest['MACD'] > latest['MACD_Signal']:
-                signals.append('macd_bullish')
-            else:
-                signals.append('macd_bearish')
-
-        if pd.notna(latest['SMA_20']):
-            if latest['Close'] > latest['SMA_20']:
-                signals.append('price_above_sma20')
-            else:
-                signals.append('price_below_sma20')
-
-        bullish_signals = sum([
-            'bullish_trend' in signals,
-            'oversold' in signals,
-            'macd_bullish' in signals,
-            'price_above_sma20' in signals
-        ])
-
-        bearish_signals = sum([
-            'bearish_trend' in signals,
-            'overbought' in signals,
-            'macd_bearish' in signals,
-            'price_below_sma20' in signals
-        ])
-
-        if bullish_signals >= 3:
-            signal = "BUY"
-            strength = "STRONG"
-        elif bullish_signals >= 2:
-            signal = "BUY"
-            strength = "MODERATE"
-        elif bearish_signals >= 3:
-            signal = "SELL"
-            strength = "STRONG"
-        elif bearish_signals >= 2:
-            signal = "SELL"
-            strength = "MODERATE"
+            bearish |= TREND
+
+    if not math.isnan(latest.rsi):
+        if latest.rsi < 30:
+            bullish |= RSI_EXTREME
+        elif latest.rsi > 70:
+            bearish |= RSI_EXTREME
+
+    if not math.isnan(latest.macd) and not math.isnan(latest.macd_signal):
+        if latest.macd > latest.macd_signal:
+            bullish |= MACD_CROSS
         else:
-            signal = "HOLD"
-            strength = "NEUTRAL"
-
-        # Generate recommendation
-        recommendations = []
-        if signal == "BUY":
-            recommendations.append(f"Strong buying opportunity detected for {symbol}.")
-            if 'oversold' in signals:
-                recommendations.append(f"RSI indicates oversold conditions ({latest['RSI']:.2f}).")
-        elif signal == "SELL":
-            recommendations.append(f"Consider selling or taking profits on {symbol}.")
-            if 'overbought' in signals:
-                recommendations.append(f"RSI indicates overbought conditions ({latest['RSI']:.2f}).")
+            bearish |= MACD_CROSS
+
+    if not math.isnan(latest.sma_20):
+        if latest.close > latest.sma_20:
+            bullish |= PRICE_VS_SMA20
         else:
-            recommendations.append(f"Hold position and wait for clearer signals on {symbol}.")
-
-        recommendation = " ".join(recommendations)
-
-        # Prepare chart data
-        chart_data = df.tail(50).reset_index()
-        price_data = []
-        for _, row in chart_data.iterrows():
-            ts = row.get('Datetime') or row.get('Date')
-            price_data.append({
-                'timestamp': ts.strftime('%Y-%m-%d %H:%M') if timeframe == '15m' else ts.strftime('%Y-%m-%d'),
-                'open': float(row['Open']),
-                'high': float(row['High']),
-                'low': float(row['Low']),
-                'close': float(row['Close']),
-                'volume': int(row['Volume'])
-            })
-
-        return {
-            'symbol': symbol,
-            'timeframe': timeframe,
-            'current_price': float(latest['Close']),
-            'signal': signal,
-            'signal_strength': strength,
-            'indicators': {
-                'sma_20': float(latest['SMA_20']) if pd.notna(latest['SMA_20']) else 0,
-                'sma_50': float(latest['SMA_50']) if pd.notna(latest['SMA_50']) else 0,
-                'rsi': float(latest['RSI']) if pd.notna(latest['RSI']) else 0,
-                'macd': float(latest['MACD']) if pd.notna(latest['MACD']) else 0,
-                'macd_signal': float(latest['MACD_Signal']) if pd.notna(latest['MACD_Signal']) else 0,
-            },
-            'recommendation': recommendation,
-            'price_data': price_data
-        }
+            bearish |= PRICE_VS_SMA20
+
+    bullish_signals = bullish.bit_count()
+    bearish_signals = bearish.bit_count()
+
+    signal, strength = _SIGNAL_TABLE[bullish_signals * 5 + bearish_signals]
+
+    # Generate recommendation
+    recommendations = []
+    if signal == "BUY":
+        recommendations.append(f"Strong buying opportunity detected for {symbol}.")
+        if bullish & RSI_EXTREME:
+            recommendations.append(f"RSI indicates oversold conditions ({latest.rsi:.2f}).")
+    elif signal == "SELL":
+        recommendations.append(f"Consider selling or taking profits on {symbol}.")
+        if bearish & RSI_EXTREME:
+            recommendations.append(f"RSI indicates overbought conditions ({latest.rsi:.2f}).")
+    else:
+        recommendations.append(f"Hold position and wait for clearer signals on {symbol}.")
+
+    recommendation = " ".join(recommendations)
+
+    # Prepare chart data, column-wise rather than row by row
+    timestamps = df.index[-50:].strftime('%Y-%m-%d %H:%M' if timeframe == '15m' else '%Y-%m-%d').tolist()
+    opens, highs, lows, closes = (df[col].to_numpy(dtype=np.float64)[-50:].tolist() for col in ('Open', 'High', 'Low', 'Close'))
+    volumes = df['Volume'].to_numpy(dtype=np.int64)[-50:].tolist()
+    price_data = [
+        {'timestamp': ts, 'open': o, 'high': h, 'low': l, 'close': c, 'volume': v}
+        for ts, o, h, l, c, v in zip(timestamps, opens, highs, lows, closes, volumes)
+    ]
+
+    return {
+        'symbol': symbol,
+        'timeframe': timeframe,
+        'current_price': latest.close,
+        'signal': signal,
+        'signal_strength': strength,
+        'indicators': {
+            'sma_20': latest.sma_20 if not math.isnan(latest.sma_20) else 0,
+            'sma_50': latest.sma_50 if not math.isnan(latest.sma_50) else 0,
+            'rsi': latest.rsi if not math.isnan(latest.rsi) else 0,
+            'macd': latest.macd if not math.isnan(latest.macd) else 0,
+            'macd_signal': latest.macd_signal if not math.isnan(latest.macd_signal) else 0,
+        },
+        'recommendation': recommendation,
+        'price_data': price_data
+    }
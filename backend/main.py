@@ -1,14 +1,41 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
+import io
+import logging
+import math
+import os
+import threading
+import time
+from functools import lru_cache
+from typing import NamedTuple
+from concurrent.futures import Future
+import requests
+from requests.adapters import HTTPAdapter
 import yfinance as yf
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
-from ta.trend import SMAIndicator, MACD
-from ta.momentum import RSIIndicator
+from cachetools import TTLCache
+from numba import njit
+import anyio.to_thread
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+# Worker threads for blocking analysis; the Yahoo connection pool is sized
+# to match so no thread has to wait on, or discard, a keep-alive connection
+_MAX_THREADS = 100
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Analysis blocks on yfinance/pandas in worker threads; the AnyIO default
+    # of 40 threads caps concurrent requests well below what Yahoo can serve
+    anyio.to_thread.current_default_thread_limiter().total_tokens = _MAX_THREADS
+    yield
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -18,6 +45,250 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-process cache; each uvicorn worker keeps its own copy.
+# Intraday bars go stale quickly; daily bars only change once per session.
+# Entries live for twice their TTL so a stale frame can be served while it
+# is refreshed in the background.
+_history_ttls = {"15m": 60, "1d": 3600}
+_history_caches = {
+    timeframe: TTLCache(maxsize=1024, ttl=2 * ttl) for timeframe, ttl in _history_ttls.items()
+}
+_cache_lock = threading.Lock()
+_inflight = {}
+
+# One keep-alive session per worker process for every Yahoo request,
+# instead of one per Ticker. The default pool keeps only 10 connections per
+# host, fewer than the threads that share it.
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_maxsize=_MAX_THREADS))
+
+@lru_cache(maxsize=2048)
+def _ticker(symbol: str) -> yf.Ticker:
+    return yf.Ticker(symbol, session=_session)
+
+def _fetch_history(symbol: str, timeframe: str):
+    ticker = _ticker(symbol)
+
+    if timeframe == "15m":
+        # Get 7 days of 15-minute data
+        return ticker.history(period="7d", interval="15m")
+    # Get 1 year of daily data
+    return ticker.history(period="1y", interval="1d")
+
+# Optional second tier shared by every uvicorn worker; redis is only
+# imported when it is configured, and frames are stored as parquet, so it
+# stays off without pyarrow. Short socket timeouts keep a hung Redis from
+# stalling cache misses.
+_redis = None
+if os.environ.get("REDIS_URL"):
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        logger.warning("REDIS_URL is set but pyarrow is not installed; Redis history cache disabled")
+    else:
+        import redis
+        _redis = redis.Redis.from_url(
+            os.environ["REDIS_URL"], socket_connect_timeout=0.5, socket_timeout=0.5
+        )
+
+def _load_history(symbol: str, timeframe: str, ttl: float):
+    """Fetch history through the shared Redis cache when configured.
+
+    Returns (df, fetched_at). A frame read from Redis is stamped with the start
+    of its bucket, so reloading it never makes it look fresher than it is.
+    """
+    if _redis is None:
+        return _fetch_history(symbol, timeframe), time.time()
+
+    # Keys roll over on TTL boundaries, so all workers agree on freshness
+    bucket = int(time.time() // ttl)
+    key = f"history:{symbol}:{timeframe}:{bucket}"
+    # Any Redis or parquet failure (timeout, corrupt payload) is logged and
+    # falls through to Yahoo
+    try:
+        payload = _redis.get(key)
+        if payload is not None:
+            return pd.read_parquet(io.BytesIO(payload)), bucket * ttl
+    except Exception:
+        logger.warning("Redis history read failed for %s", key, exc_info=True)
+
+    df = _fetch_history(symbol, timeframe)
+    fetched_at = time.time()
+    if not df.empty:
+        try:
+            buf = io.BytesIO()
+            df.to_parquet(buf)
+            _redis.set(key, buf.getvalue(), ex=int(ttl))
+        except Exception:
+            logger.warning("Redis history write failed for %s", key, exc_info=True)
+    return df, fetched_at
+
+def _refresh_history(symbol: str, timeframe: str, future: Future):
+    """Fetch into the cache and resolve the in-flight future for this key"""
+    frame = "15m" if timeframe == "15m" else "1d"
+    key = (symbol, timeframe)
+    try:
+        df, fetched_at = _load_history(symbol, timeframe, _history_ttls[frame])
+        if not df.empty:
+            with _cache_lock:
+                _history_caches[frame][key] = (df, fetched_at)
+        future.set_result(df)
+    except Exception as e:
+        future.set_exception(e)
+    finally:
+        with _cache_lock:
+            _inflight.pop(key, None)
+
+def _cached_history(symbol: str, timeframe: str):
+    """Return price history, hitting Yahoo at most once per key per TTL"""
+    frame = "15m" if timeframe == "15m" else "1d"
+    key = (symbol, timeframe)
+
+    with _cache_lock:
+        entry = _history_caches[frame].get(key)
+        refreshing = key in _inflight
+        # Anything older than twice the TTL is treated as a miss, even if the
+        # cache (which times entries from insertion) still holds it
+        age = time.time() - entry[1] if entry is not None else None
+        if age is not None and age < 2 * _history_ttls[frame]:
+            if age >= _history_ttls[frame] and not refreshing:
+                # Serve the stale frame now and refresh it off the request path
+                future = Future()
+                _inflight[key] = future
+                threading.Thread(
+                    target=_refresh_history, args=(symbol, timeframe, future), daemon=True
+                ).start()
+            return entry[0]
+        # Concurrent misses on the same key wait on the one pending fetch
+        if refreshing:
+            future = _inflight[key]
+            leader = False
+        else:
+            leader = True
+            future = Future()
+            _inflight[key] = future
+
+    if leader:
+        _refresh_history(symbol, timeframe, future)
+    return future.result()
+
+# No fastmath: closes can be NaN, and the comparisons below must treat NaN
+# the way pandas does
+@njit('float64(float32[:], int64)', cache=True)
+def _tail_mean(close, window):
+    n = close.shape[0]
+    if n < window:
+        return np.nan
+    total = 0.0
+    for i in range(n - window, n):
+        total += close[i]
+    return total / window
+
+@njit('UniTuple(float64, 2)(float64, float64, float64, float64)', cache=True)
+def _ewm_step(value, old_wt, x, alpha):
+    """One step of pandas ewm(adjust=False); returns (value, old_wt).
+
+    A NaN observation leaves the value as is but decays its weight, so the
+    next real observation counts for more, exactly as pandas does.
+    """
+    if value != value:
+        return x, 1.0
+    old_wt *= 1.0 - alpha
+    if x == x:
+        value = (old_wt * value + alpha * x) / (old_wt + alpha)
+        old_wt = 1.0
+    return value, old_wt
+
+@njit('UniTuple(float64, 5)(float32[:])', cache=True)
+def _latest_indicator_kernel(close):
+    """Return the last bar's SMA(20), SMA(50), RSI(14), MACD and MACD signal.
+
+    Mirrors the ta library defaults: Wilder-smoothed RSI and MACD(12, 26, 9),
+    each NaN until its window is full.
+    """
+    n = close.shape[0]
+    sma_20 = _tail_mean(close, 20)
+    sma_50 = _tail_mean(close, 50)
+
+    a_rsi = 1.0 / 14.0
+    a_fast, a_slow, a_sign = 2.0 / 13.0, 2.0 / 27.0, 2.0 / 10.0
+    avg_gain = avg_loss = 0.0
+    ema_fast = ema_slow = signal = np.nan
+    w_fast = w_slow = w_sign = 1.0
+    macd = np.nan
+    n_close = n_macd = 0
+
+    for i in range(n):
+        x = np.float64(close[i])
+        if i >= 1:
+            # A delta touching a NaN close counts as neither gain nor loss
+            d = x - close[i - 1]
+            avg_gain += a_rsi * ((d if d > 0.0 else 0.0) - avg_gain)
+            avg_loss += a_rsi * ((-d if d < 0.0 else 0.0) - avg_loss)
+
+        if x == x:
+            n_close += 1
+        ema_fast, w_fast = _ewm_step(ema_fast, w_fast, x, a_fast)
+        ema_slow, w_slow = _ewm_step(ema_slow, w_slow, x, a_slow)
+        # MACD exists once the slow EMA has 26 observations; the signal line
+        # is its EMA and needs 9 MACD values of its own
+        macd = ema_fast - ema_slow if n_close >= 26 else np.nan
+        if macd == macd:
+            n_macd += 1
+        signal, w_sign = _ewm_step(signal, w_sign, macd, a_sign)
+
+    if n < 14:
+        rsi = np.nan
+    elif avg_loss == 0.0:
+        rsi = 100.0
+    else:
+        rsi = 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+
+    if n_macd < 9:
+        signal = np.nan
+
+    return sma_20, sma_50, rsi, macd, signal
+
+# Signal bits: each check sets its bit in either the bullish or the bearish mask
+TREND = 1           # SMA 20 above / below SMA 50
+RSI_EXTREME = 2     # RSI oversold / overbought
+MACD_CROSS = 4      # MACD above / below its signal line
+PRICE_VS_SMA20 = 8  # Close above / below SMA 20
+
+def _classify_signal(bullish_signals: int, bearish_signals: int):
+    if bullish_signals >= 3:
+        return "BUY", "STRONG"
+    if bullish_signals >= 2:
+        return "BUY", "MODERATE"
+    if bearish_signals >= 3:
+        return "SELL", "STRONG"
+    if bearish_signals >= 2:
+        return "SELL", "MODERATE"
+    return "HOLD", "NEUTRAL"
+
+# (signal, strength) for every (bullish, bearish) count pair, indexed bull * 5 + bear
+_SIGNAL_TABLE = tuple(
+    _classify_signal(bull, bear) for bull in range(5) for bear in range(5)
+)
+
+class Indicators(NamedTuple):
+    close: float
+    # The close as the kernel saw it (float32); compare this, not close,
+    # against the SMAs so a flat tail doesn't read as above its own average
+    kernel_close: float
+    sma_20: float
+    sma_50: float
+    rsi: float
+    macd: float
+    macd_signal: float
+
+def compute_latest_indicators(close: np.ndarray) -> Indicators:
+    """Indicator values for the most recent bar"""
+    # float32 is ample for indicators reported to two decimals; the kernel
+    # still accumulates in float64
+    close_32 = close.astype(np.float32)
+    return Indicators(float(close[-1]), float(close_32[-1]), *_latest_indicator_kernel(close_32))
+
 class AnalysisRequest(BaseModel):
     symbol: str
     timeframe: str = "15m"
@@ -30,14 +301,7 @@ class TradingAnalyzer:
     def fetch_data(self):
         """Fetch data from Yahoo Finance"""
         try:
-            ticker = yf.Ticker(self.symbol)
-
-            if self.timeframe == "15m":
-                # Get 7 days of 15-minute data
-                df = ticker.history(period="7d", interval="15m")
-            else:  # 1d
-                # Get 1 year of daily data
-                df = ticker.history(period="1y", interval="1d")
+            df = _cached_history(self.symbol, self.timeframe)
 
             if df.empty:
                 raise ValueError(f"No data found for {self.symbol}")
@@ -47,112 +311,68 @@ class TradingAnalyzer:
             raise HTTPException(status_code=400, detail=f"Error fetching data: {str(e)}")
 
     def calculate_indicators(self, df):
-        """Calculate technical indicators"""
-        # Simple Moving Averages
-        sma_20 = SMAIndicator(close=df['Close'], window=20)
-        df['SMA_20'] = sma_20.sma_indicator()
-
-        sma_50 = SMAIndicator(close=df['Close'], window=50)
-        df['SMA_50'] = sma_50.sma_indicator()
-
-        # RSI
-        rsi = RSIIndicator(close=df['Close'], window=14)
-        df['RSI'] = rsi.rsi()
+        """Calculate technical indicators for the latest bar"""
+        return compute_latest_indicators(df['Close'].to_numpy(dtype=np.float64))
 
-        # MACD
-        macd = MACD(close=df['Close'])
-        df['MACD'] = macd.macd()
-        df['MACD_Signal'] = macd.macd_signal()
-        df['MACD_Diff'] = macd.macd_diff()
-
-        return df
-
-    def generate_signal(self, df):
+    def generate_signal(self, latest):
         """Generate trading signal based on technical indicators"""
-        latest = df.iloc[-1]
-
-        signals = []
+        bullish = bearish = 0
 
         # Trend Analysis (SMA)
-        if pd.notna(latest['SMA_20']) and pd.notna(latest['SMA_50']):
-            if latest['SMA_20'] > latest['SMA_50']:
-                signals.append('bullish_trend')
+        if not math.isnan(latest.sma_20) and not math.isnan(latest.sma_50):
+            if latest.sma_20 > latest.sma_50:
+                bullish |= TREND
             else:
-                signals.append('bearish_trend')
+                bearish |= TREND
 
         # RSI Analysis
-        if pd.notna(latest['RSI']):
-            if latest['RSI'] < 30:
-                signals.append('oversold')
-            elif latest['RSI'] > 70:
-                signals.append('overbought')
+        if not math.isnan(latest.rsi):
+            if latest.rsi < 30:
+                bullish |= RSI_EXTREME
+            elif latest.rsi > 70:
+                bearish |= RSI_EXTREME
 
         # MACD Analysis
-        if pd.notna(latest['MACD']) and pd.notna(latest['MACD_Signal']):
-            if latest['MACD'] > latest['MACD_Signal']:
-                signals.append('macd_bullish')
+        if not math.isnan(latest.macd) and not math.isnan(latest.macd_signal):
+            if latest.macd > latest.macd_signal:
+                bullish |= MACD_CROSS
             else:
-                signals.append('macd_bearish')
+                bearish |= MACD_CROSS
 
         # Price vs SMA
-        if pd.notna(latest['SMA_20']):
-            if latest['Close'] > latest['SMA_20']:
-                signals.append('price_above_sma20')
+        if not math.isnan(latest.sma_20):
+            if latest.kernel_close > latest.sma_20:
+                bullish |= PRICE_VS_SMA20
             else:
-                signals.append('price_below_sma20')
+                bearish |= PRICE_VS_SMA20
 
         # Generate final signal
-        bullish_signals = sum([
-            'bullish_trend' in signals,
-            'oversold' in signals,
-            'macd_bullish' in signals,
-            'price_above_sma20' in signals
-        ])
-
-        bearish_signals = sum([
-            'bearish_trend' in signals,
-            'overbought' in signals,
-            'macd_bearish' in signals,
-            'price_below_sma20' in signals
-        ])
-
-        if bullish_signals >= 3:
-            signal = "BUY"
-            strength = "STRONG"
-        elif bullish_signals >= 2:
-            signal = "BUY"
-            strength = "MODERATE"
-        elif bearish_signals >= 3:
-            signal = "SELL"
-            strength = "STRONG"
-        elif bearish_signals >= 2:
-            signal = "SELL"
-            strength = "MODERATE"
-        else:
-            signal = "HOLD"
-            strength = "NEUTRAL"
+        bullish_signals = bullish.bit_count()
+        bearish_signals = bearish.bit_count()
+
+        signal, strength = _SIGNAL_TABLE[bullish_signals * 5 + bearish_signals]
 
-        return signal, strength, signals
+        return signal, strength, bullish, bearish
 
-    def generate_recommendation(self, signal, strength, signals, latest):
+    def generate_recommendation(self, signal, strength, bullish, bearish, latest):
         """Generate trading recommendation"""
         recommendations = []
 
         if signal == "BUY":
             recommendations.append(f"Strong buying opportunity detected for {self.symbol}.")
-            if 'oversold' in signals:
-                recommendations.append(f"RSI indicates oversold conditions ({latest['RSI']:.2f}).")
-            if 'bullish_trend' in signals:
+            if bullish & RSI_EXTREME:
+                recommendations.append(f"RSI indicates oversold conditions ({latest.rsi:.2f}).")
+            if bullish & TREND:
                 recommendations.append("Short-term trend is above long-term trend (bullish).")
-            if 'macd_bullish' in signals:
+            if bullish & MACD_CROSS:
                 recommendations.append("MACD crossed above signal line (bullish momentum).")
         elif signal == "SELL":
             recommendations.append(f"Consider selling or taking profits on {self.symbol}.")
-            if 'overbought' in signals:
-                recommendations.append(f"RSI indicates overbought conditions ({latest['RSI']:.2f}).")
-            if 'bearish_trend' in signals:
+            if bearish & RSI_EXTREME:
+                recommendations.append(f"RSI indicates overbought conditions ({latest.rsi:.2f}).")
+            if bearish & TREND:
                 recommendations.append("Short-term trend is below long-term trend (bearish).")
-            if 'macd_bearish' in signals:
+            if bearish & MACD_CROSS:
                 recommendations.append("MACD crossed below signal line (bearish momentum).")
         else:
             recommendations.append(f"Hold position and wait for clearer signals on {self.symbol}.")
@@ -162,39 +382,35 @@ class TradingAnalyzer:
 
     def analyze(self):
         """Perform complete analysis"""
+        # Shared with other requests through the cache; not mutated
         df = self.fetch_data()
-        df = self.calculate_indicators(df)
-
-        signal, strength, signals = self.generate_signal(df)
-        latest = df.iloc[-1]
-
-        recommendation = self.generate_recommendation(signal, strength, signals, latest)
-
-        # Prepare price data for chart (last 50 points)
-        chart_data = df.tail(50).reset_index()
-        price_data = []
-        for _, row in chart_data.iterrows():
-            price_data.append({
-                'timestamp': row['Datetime'].strftime('%Y-%m-%d %H:%M') if self.timeframe == '15m' else row['Date'].strftime('%Y-%m-%d'),
-                'open': float(row['Open']),
-                'high': float(row['High']),
-                'low': float(row['Low']),
-                'close': float(row['Close']),
-                'volume': int(row['Volume'])
-            })
+        latest = self.calculate_indicators(df)
+
+        signal, strength, bullish, bearish = self.generate_signal(latest)
+
+        recommendation = self.generate_recommendation(signal, strength, bullish, bearish, latest)
+
+        # Prepare price data for chart (last 50 points), column-wise
+        timestamps = df.index[-50:].strftime('%Y-%m-%d %H:%M' if self.timeframe == '15m' else '%Y-%m-%d').tolist()
+        opens, highs, lows, closes = (df[col].to_numpy(dtype=np.float64)[-50:].tolist() for col in ('Open', 'High', 'Low', 'Close'))
+        volumes = df['Volume'].to_numpy(dtype=np.int64)[-50:].tolist()
+        price_data = [
+            {'timestamp': ts, 'open': o, 'high': h, 'low': l, 'close': c, 'volume': v}
+            for ts, o, h, l, c, v in zip(timestamps, opens, highs, lows, closes, volumes)
+        ]
 
         return {
             'symbol': self.symbol,
             'timeframe': self.timeframe,
-            'current_price': float(latest['Close']),
+            'current_price': latest.close,
             'signal': signal,
             'signal_strength': strength,
             'indicators': {
-                'sma_20': float(latest['SMA_20']) if pd.notna(latest['SMA_20']) else 0,
-                'sma_50': float(latest['SMA_50']) if pd.notna(latest['SMA_50']) else 0,
-                'rsi': float(latest['RSI']) if pd.notna(latest['RSI']) else 0,
-                'macd': float(latest['MACD']) if pd.notna(latest['MACD']) else 0,
-                'macd_signal': float(latest['MACD_Signal']) if pd.notna(latest['MACD_Signal']) else 0,
+                'sma_20': latest.sma_20 if not math.isnan(latest.sma_20) else 0,
+                'sma_50': latest.sma_50 if not math.isnan(latest.sma_50) else 0,
+                'rsi': latest.rsi if not math.isnan(latest.rsi) else 0,
+                'macd': latest.macd if not math.isnan(latest.macd) else 0,
+                'macd_signal': latest.macd_signal if not math.isnan(latest.macd_signal) else 0,
             },
             'recommendation': recommendation,
             'price_data': price_data
@@ -209,8 +425,10 @@ async def analyze_stock(request: AnalysisRequest):
     """Analyze stock and generate trading signals"""
     try:
         analyzer = TradingAnalyzer(request.symbol, request.timeframe)
-        result = analyzer.analyze()
-        return result
+        # Fetch and indicator math are blocking; keep them off the event loop
+        result = await run_in_threadpool(analyzer.analyze)
+        # Returned as a response so FastAPI skips jsonable_encoder on it
+        return ORJSONResponse(result)
     except HTTPException as he:
         raise he
     except Exception as e:
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from main import compute_latest_indicators
+
+ta = pytest.importorskip("ta")
+
+
+def _ta_latest(close: np.ndarray):
+    series = pd.Series(close)
+    macd = ta.trend.MACD(close=series)
+    return [
+        ta.trend.SMAIndicator(close=series, window=20).sma_indicator().iloc[-1],
+        ta.trend.SMAIndicator(close=series, window=50).sma_indicator().iloc[-1],
+        ta.momentum.RSIIndicator(close=series, window=14).rsi().iloc[-1],
+        macd.macd().iloc[-1],
+        macd.macd_signal().iloc[-1],
+    ]
+
+
+@pytest.mark.parametrize("n", [1, 14, 26, 34, 60, 200, 672])
+@pytest.mark.parametrize("nan_at", [None, 0, 5, 30, 150, -1])
+def test_latest_indicators_match_ta(n, nan_at):
+    rng = np.random.default_rng(n)
+    close = 100 + np.cumsum(rng.normal(0, 1, n))
+    if nan_at is not None and -n <= nan_at < n:
+        close[nan_at] = np.nan
+
+    latest = compute_latest_indicators(close)
+    got = [latest.sma_20, latest.sma_50, latest.rsi, latest.macd, latest.macd_signal]
+
+    # The kernel reads float32 closes, so allow float32-level differences
+    np.testing.assert_allclose(got, _ta_latest(close), rtol=1e-4, atol=1e-3, equal_nan=True)
+
+
+def test_flat_close_is_not_above_its_sma():
+    close = np.full(60, 100.1)
+
+    latest = compute_latest_indicators(close)
+
+    assert latest.close == 100.1
+    assert not latest.kernel_close > latest.sma_20